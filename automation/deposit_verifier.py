@@ -0,0 +1,389 @@
+"""
+Automated deposit verification worker
+
+Pending deposits are collected in batches, checked in bulk against a
+pluggable chain-data provider and auto-approved when the on-chain transfer
+matches exactly. Anything that does not match is reported to the admins
+for manual review.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import requests
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from config.settings import settings
+from database import credited_hashes
+
+logger = logging.getLogger(__name__)
+
+
+class ChainTransfer(NamedTuple):
+    """A transfer as reported by the chain-data provider"""
+    tx_hash: str
+    to_address: str
+    amount: Decimal
+    currency: str
+    confirmations: int
+
+
+class PendingDeposit(NamedTuple):
+    """A deposit transaction waiting for verification"""
+    transaction_id: int
+    user_id: int
+    tx_hash: str
+    amount: Decimal
+    currency: str
+    created_at: datetime
+
+
+def same_address(chain_address: str, expected_address: str) -> bool:
+    """Compare wallet addresses; 0x hex addresses ignore EIP-55 checksum casing, base58 is exact"""
+    chain_address, expected_address = chain_address.strip(), expected_address.strip()
+    if chain_address[:2].lower() == '0x' and expected_address[:2].lower() == '0x':
+        return chain_address.lower() == expected_address.lower()
+    return chain_address == expected_address
+
+
+def _parse_transfer(tx_hash: str, raw: Optional[dict]) -> Optional[ChainTransfer]:
+    """Build a ChainTransfer from a provider record, None if missing or malformed"""
+    if not raw:
+        return None
+    try:
+        return ChainTransfer(
+            tx_hash=tx_hash,
+            to_address=str(raw['to_address']),
+            amount=Decimal(str(raw['amount'])),
+            currency=str(raw.get('currency', 'USDT')).upper(),
+            confirmations=int(raw.get('confirmations', 0))
+        )
+    except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+        logger.warning(f"Malformed chain record for {tx_hash}: {e}")
+        return None
+
+
+class ChainDataProvider(ABC):
+    """Interface for looking up transfers by transaction hash"""
+
+    name = 'base'
+
+    @abstractmethod
+    async def get_transfers(self, tx_hashes: Sequence[str]) -> Dict[str, Optional[ChainTransfer]]:
+        """Return a transfer (or None when unknown) for every requested hash"""
+
+
+class FileChainProvider(ChainDataProvider):
+    """Reads transfers from a local JSON file keyed by transaction hash"""
+
+    name = 'file'
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def get_transfers(self, tx_hashes: Sequence[str]) -> Dict[str, Optional[ChainTransfer]]:
+        records = await asyncio.to_thread(self._load)
+        return {tx_hash: _parse_transfer(tx_hash, records.get(tx_hash)) for tx_hash in tx_hashes}
+
+
+class HttpChainProvider(ChainDataProvider):
+    """Posts a batch of hashes to an HTTP endpoint returning JSON keyed by hash"""
+
+    name = 'http'
+
+    def __init__(self, url: str, timeout: float = 10.0, api_key: Optional[str] = None):
+        self.url = url
+        self.timeout = timeout
+        self.api_key = api_key
+
+    def _fetch(self, tx_hashes: Sequence[str]) -> dict:
+        headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+        response = requests.post(
+            self.url,
+            json={'tx_hashes': list(tx_hashes)},
+            headers=headers,
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def get_transfers(self, tx_hashes: Sequence[str]) -> Dict[str, Optional[ChainTransfer]]:
+        records = await asyncio.to_thread(self._fetch, tx_hashes)
+        return {tx_hash: _parse_transfer(tx_hash, records.get(tx_hash)) for tx_hash in tx_hashes}
+
+
+def create_chain_provider(source: Optional[str]) -> Optional[ChainDataProvider]:
+    """Pick a provider from a source string: http(s) URL or JSON file path"""
+    if not source:
+        return None
+    if source.startswith(('http://', 'https://')):
+        return HttpChainProvider(source, api_key=os.getenv('CHAIN_DATA_API_KEY'))
+    return FileChainProvider(source)
+
+
+class VerificationMetrics:
+    """Counters and clear-time samples for verified deposits"""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.clear_times: List[float] = []
+        self.counts = {'checked': 0, 'approved': 0, 'anomalies': 0, 'unconfirmed': 0,
+                       'cache_hits': 0, 'provider_errors': 0}
+
+    def record_clear_time(self, seconds: float):
+        self.clear_times.append(seconds)
+        if len(self.clear_times) > self.max_samples:
+            del self.clear_times[:len(self.clear_times) - self.max_samples]
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.clear_times)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            **self.counts,
+            'clear_time_p50': percentile(0.50),
+            'clear_time_p95': percentile(0.95),
+            'clear_time_max': samples[-1] if samples else 0.0
+        }
+
+
+class DepositVerifier:
+    """Background worker that verifies pending deposits against chain data
+
+    ``pending_loader`` returns the current PendingDeposit list and
+    ``approver`` credits one deposit through the same wallet path used by
+    the admin approve button. Both must be assigned before ``start()``,
+    alongside ``bot``, the same way ``profit_scheduler.bot`` is; without
+    them the verifier refuses to start.
+
+    A transfer may only ever be credited once, since the deposit address is
+    shared and tx hashes are public. The verifier sends any hash claimed by
+    more than one pending deposit to the admins, and any hash already in
+    ``credited_tx_hashes`` (which survives archival of old transactions).
+    The storage layer must enforce the rest: ``approver`` must call
+    ``credited_hashes.record_credit`` in the same database transaction as
+    the credit and, when that returns False, roll back and return False; and
+    ``pending_loader`` should leave out deposits whose hash is already
+    credited.
+    """
+
+    def __init__(self, provider: Optional[ChainDataProvider] = None, batch_size: int = 50,
+                 max_concurrency: int = 4, cache_ttl: float = 300.0, miss_ttl: float = 30.0,
+                 min_confirmations: int = 1, unconfirmed_alert_after: float = 6 * 3600,
+                 interval: float = 60.0, engine: Optional[Engine] = None):
+        self.provider = provider
+        self._engine = engine
+        self._ready = False
+        self.batch_size = batch_size
+        self.cache_ttl = cache_ttl
+        self.miss_ttl = miss_ttl
+        self.min_confirmations = min_confirmations
+        self.unconfirmed_alert_after = unconfirmed_alert_after
+        self.interval = interval
+        self.bot = None
+        self.pending_loader: Optional[Callable[[], Awaitable[Sequence[PendingDeposit]]]] = None
+        self.approver: Optional[Callable[[int], Awaitable[bool]]] = None
+        self.metrics = VerificationMetrics()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cache: Dict[str, tuple] = {}
+        self._alerted: set = set()
+        self._approved_hashes: OrderedDict = OrderedDict()
+        self.max_approved_hashes = 10000
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(settings.DATABASE_URL)
+        if not self._ready:
+            credited_hashes.metadata.create_all(self._engine)
+            self._ready = True
+        return self._engine
+
+    def _credited(self, tx_hashes: List[str]) -> set:
+        with self.engine.connect() as conn:
+            return credited_hashes.credited(conn, tx_hashes)
+
+    def _expected_address(self, currency: str) -> Optional[str]:
+        return getattr(settings, f"{currency.upper()}_WALLET_ADDRESS", None)
+
+    def _cache_get(self, tx_hash: str):
+        entry = self._cache.get(tx_hash)
+        if entry and entry[0] > time.monotonic():
+            self.metrics.counts['cache_hits'] += 1
+            return True, entry[1]
+        self._cache.pop(tx_hash, None)
+        return False, None
+
+    def _cache_put(self, tx_hash: str, transfer: Optional[ChainTransfer]):
+        ttl = self.cache_ttl if transfer and transfer.confirmations >= self.min_confirmations else self.miss_ttl
+        self._cache[tx_hash] = (time.monotonic() + ttl, transfer)
+
+    async def _lookup_batch(self, tx_hashes: List[str]) -> Dict[str, Optional[ChainTransfer]]:
+        async with self._semaphore:
+            try:
+                transfers = await self.provider.get_transfers(tx_hashes)
+            except Exception as e:
+                self.metrics.counts['provider_errors'] += 1
+                logger.error(f"Chain provider {self.provider.name} failed for {len(tx_hashes)} hashes: {e}")
+                return {}
+        for tx_hash in tx_hashes:
+            self._cache_put(tx_hash, transfers.get(tx_hash))
+        return transfers
+
+    async def lookup(self, tx_hashes: Iterable[str]) -> Dict[str, Optional[ChainTransfer]]:
+        """Resolve hashes from the cache, fetching the rest in concurrent batches"""
+        results, missing = {}, []
+        for tx_hash in dict.fromkeys(tx_hashes):
+            hit, transfer = self._cache_get(tx_hash)
+            if hit:
+                results[tx_hash] = transfer
+            else:
+                missing.append(tx_hash)
+
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        for transfers in await asyncio.gather(*(self._lookup_batch(batch) for batch in batches)):
+            results.update(transfers)
+        return results
+
+    def classify(self, deposit: PendingDeposit, transfer: Optional[ChainTransfer]) -> Optional[str]:
+        """Return None for an exact match, 'unconfirmed' to retry later, or an anomaly reason"""
+        if transfer is None:
+            return 'unconfirmed'
+        if transfer.currency != deposit.currency.upper():
+            return f"currency mismatch: chain {transfer.currency}, expected {deposit.currency}"
+        expected_address = self._expected_address(deposit.currency)
+        if expected_address and not same_address(transfer.to_address, expected_address):
+            return f"sent to {transfer.to_address}, not the platform wallet"
+        if transfer.amount != Decimal(str(deposit.amount)):
+            return f"amount mismatch: chain {transfer.amount}, requested {deposit.amount}"
+        if transfer.confirmations < self.min_confirmations:
+            return 'unconfirmed'
+        return None
+
+    async def run_once(self) -> dict:
+        """Verify every pending deposit once and return a summary"""
+        summary = {'checked': 0, 'approved': 0, 'anomalies': 0, 'unconfirmed': 0}
+        if not self.provider or not self.pending_loader or not self.approver:
+            return summary
+
+        deposits = [d for d in await self.pending_loader() if d.tx_hash]
+        # Forget alerts for deposits that are no longer pending
+        self._alerted &= {d.transaction_id for d in deposits}
+        claims = Counter(d.tx_hash for d in deposits)
+        already_credited = await asyncio.to_thread(self._credited, list(claims)) if claims else set()
+        transfers = await self.lookup(claims)
+        anomalies = []
+
+        for deposit in deposits:
+            summary['checked'] += 1
+            if claims[deposit.tx_hash] > 1:
+                reason = f"tx hash claimed by {claims[deposit.tx_hash]} pending deposits"
+            elif deposit.tx_hash in self._approved_hashes or deposit.tx_hash in already_credited:
+                reason = "tx hash already credited to an approved deposit"
+            else:
+                reason = self.classify(deposit, transfers.get(deposit.tx_hash))
+
+            if reason is None:
+                try:
+                    approved = await self.approver(deposit.transaction_id)
+                except Exception as e:
+                    logger.error(f"Error auto-approving transaction {deposit.transaction_id}: {e}")
+                    approved = False
+                if approved:
+                    summary['approved'] += 1
+                    self._cache.pop(deposit.tx_hash, None)
+                    self._approved_hashes[deposit.tx_hash] = deposit.transaction_id
+                    if len(self._approved_hashes) > self.max_approved_hashes:
+                        self._approved_hashes.popitem(last=False)
+                    self.metrics.record_clear_time((datetime.utcnow() - deposit.created_at).total_seconds())
+                continue
+
+            if reason == 'unconfirmed':
+                summary['unconfirmed'] += 1
+                age = (datetime.utcnow() - deposit.created_at).total_seconds()
+                if age < self.unconfirmed_alert_after:
+                    continue
+                reason = f"not confirmed on chain after {age / 3600:.1f}h"
+
+            summary['anomalies'] += 1
+            if deposit.transaction_id not in self._alerted:
+                self._alerted.add(deposit.transaction_id)
+                anomalies.append((deposit, reason))
+
+        for key, value in summary.items():
+            self.metrics.counts[key] += value
+
+        if anomalies:
+            await self.notify_admins(anomalies)
+
+        logger.info(f"Deposit verification: {summary}")
+        return summary
+
+    async def notify_admins(self, anomalies: List[tuple]):
+        """Send the deposits that need manual review to the super admin"""
+        if not self.bot or not settings.SUPER_ADMIN_ID:
+            return
+
+        lines = [
+            f"• #{deposit.transaction_id} user {deposit.user_id}: ${deposit.amount} {deposit.currency} — {reason}"
+            for deposit, reason in anomalies[:30]
+        ]
+        if len(anomalies) > 30:
+            lines.append(f"… and {len(anomalies) - 30} more")
+
+        message = "⚠️ <b>Deposits Need Review</b>\n\n" + "\n".join(lines)
+        try:
+            await self.bot.send_message(chat_id=settings.SUPER_ADMIN_ID, text=message, parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Error sending deposit anomaly notification: {e}")
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error in deposit verification run: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the verification loop on the running event loop"""
+        if self._task:
+            return
+        if not self.provider:
+            logger.info("Deposit verifier disabled: CHAIN_DATA_SOURCE is not set")
+            return
+        if not self.pending_loader or not self.approver:
+            logger.warning("Deposit verifier not started: pending_loader and approver must be assigned first")
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run_forever())
+        logger.info(f"Deposit verifier started with {self.provider.name} provider")
+
+    def stop(self):
+        """Stop the verification loop"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+            logger.info("Deposit verifier stopped")
+
+
+# Global deposit verifier instance
+deposit_verifier = DepositVerifier(provider=create_chain_provider(os.getenv('CHAIN_DATA_SOURCE')))
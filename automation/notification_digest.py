@@ -0,0 +1,312 @@
+"""
+Batched profit notification digests
+
+The daily profit run records profits, plan completions and investment
+returns here instead of messaging each miner. After the run every user
+with a daily digest due gets one merged message; weekly users get theirs
+on the digest weekday and muted users get none. Sends are spread over a
+configurable window so interactive traffic keeps priority, and delivery
+progress is tracked for the admins. Delivered items are kept for
+``retention_days`` and then purged.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Integer, MetaData, Numeric, String, Table,
+    create_engine, delete, select, update
+)
+from sqlalchemy.engine import Engine
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+DIGEST_DAILY = 'daily'
+DIGEST_WEEKLY = 'weekly'
+DIGEST_MUTE = 'mute'
+DIGEST_MODES = (DIGEST_DAILY, DIGEST_WEEKLY, DIGEST_MUTE)
+
+KIND_PROFIT = 'profit'
+KIND_COMPLETION = 'completion'
+KIND_RETURN = 'investment_return'
+
+SEND_OK = 'sent'
+SEND_BLOCKED = 'blocked'
+SEND_FAILED = 'failed'
+
+metadata = MetaData()
+
+notification_preferences = Table(
+    'notification_preferences', metadata,
+    Column('telegram_id', BigInteger, primary_key=True),
+    Column('digest_mode', String(10), nullable=False, default=DIGEST_DAILY),
+    Column('updated_at', DateTime, default=datetime.utcnow),
+)
+
+notification_digest_items = Table(
+    'notification_digest_items', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('telegram_id', BigInteger, nullable=False, index=True),
+    Column('kind', String(20), nullable=False),
+    Column('amount', Numeric(20, 8), nullable=False, default=0),
+    Column('detail', String(100), nullable=True),
+    Column('created_at', DateTime, nullable=False, default=datetime.utcnow),
+    Column('delivered_at', DateTime, nullable=True, index=True),
+)
+
+
+class NotificationDigest:
+    """Collects per-user profit events and delivers them as one digest message"""
+
+    def __init__(self, engine: Optional[Engine] = None, window_seconds: float = 3600.0,
+                 max_rate: float = 20.0, weekly_weekday: int = 0, retention_days: int = 30):
+        self._engine = engine
+        self.window_seconds = window_seconds
+        self.retention_days = retention_days
+        self.max_rate = max_rate
+        self.weekly_weekday = weekly_weekday
+        self.bot = None
+        self.progress: Dict[str, object] = {}
+        self._pending: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._ready = False
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(settings.DATABASE_URL)
+        if not self._ready:
+            metadata.create_all(self._engine)
+            self._ready = True
+        return self._engine
+
+    def _add(self, telegram_id: int, kind: str, amount=0, detail: Optional[str] = None):
+        self._pending.append({
+            'telegram_id': telegram_id,
+            'kind': kind,
+            'amount': Decimal(str(amount)),
+            'detail': detail,
+            'created_at': datetime.utcnow()
+        })
+
+    def add_profit(self, telegram_id: int, amount, level_name: Optional[str] = None):
+        self._add(telegram_id, KIND_PROFIT, amount, level_name)
+
+    def add_completion(self, telegram_id: int, level_name: Optional[str] = None):
+        self._add(telegram_id, KIND_COMPLETION, 0, level_name)
+
+    def add_investment_return(self, telegram_id: int, amount, level_name: Optional[str] = None):
+        self._add(telegram_id, KIND_RETURN, amount, level_name)
+
+    def flush(self) -> int:
+        """Persist the events recorded during the run; returns the number stored"""
+        items, self._pending = self._pending, []
+        self._insert(items)
+        return len(items)
+
+    async def _flush_async(self) -> int:
+        # Take the items on the loop thread so events added meanwhile are not lost
+        items, self._pending = self._pending, []
+        await asyncio.to_thread(self._insert, items)
+        return len(items)
+
+    def _insert(self, items: List[dict]):
+        if items:
+            with self.engine.begin() as conn:
+                conn.execute(notification_digest_items.insert(), items)
+
+    def set_mode(self, telegram_id: int, mode: str):
+        """Choose daily, weekly or mute for a user"""
+        if mode not in DIGEST_MODES:
+            raise ValueError(f"Unknown digest mode: {mode}")
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                update(notification_preferences)
+                .where(notification_preferences.c.telegram_id == telegram_id)
+                .values(digest_mode=mode, updated_at=datetime.utcnow())
+            ).rowcount
+            if not updated:
+                conn.execute(notification_preferences.insert().values(
+                    telegram_id=telegram_id, digest_mode=mode, updated_at=datetime.utcnow()
+                ))
+
+    def get_mode(self, telegram_id: int) -> str:
+        with self.engine.connect() as conn:
+            mode = conn.execute(
+                select(notification_preferences.c.digest_mode)
+                .where(notification_preferences.c.telegram_id == telegram_id)
+            ).scalar()
+        return mode or DIGEST_DAILY
+
+    def _due_digests(self, now: datetime) -> Dict[int, List[dict]]:
+        """Undelivered items grouped by user, for users whose digest is due"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(notification_digest_items, notification_preferences.c.digest_mode)
+                .select_from(notification_digest_items.outerjoin(
+                    notification_preferences,
+                    notification_preferences.c.telegram_id == notification_digest_items.c.telegram_id
+                ))
+                .where(notification_digest_items.c.delivered_at.is_(None))
+                .order_by(notification_digest_items.c.telegram_id, notification_digest_items.c.id)
+            ).mappings().all()
+
+        digests: Dict[int, List[dict]] = defaultdict(list)
+        muted = []
+        for row in rows:
+            mode = row['digest_mode'] or DIGEST_DAILY
+            if mode == DIGEST_MUTE:
+                muted.append(row['id'])
+            elif mode == DIGEST_WEEKLY and now.weekday() != self.weekly_weekday \
+                    and now - row['created_at'] < timedelta(days=7):
+                continue
+            else:
+                digests[row['telegram_id']].append(dict(row))
+
+        if muted:
+            self._mark_delivered(muted, now)
+        return digests
+
+    def _mark_delivered(self, item_ids: List[int], now: datetime):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(notification_digest_items)
+                .where(notification_digest_items.c.id.in_(item_ids))
+                .values(delivered_at=now)
+            )
+
+    def purge_delivered(self, now: datetime) -> int:
+        """Delete items delivered more than ``retention_days`` ago; returns rows removed"""
+        cutoff = now - timedelta(days=self.retention_days)
+        with self.engine.begin() as conn:
+            return conn.execute(
+                delete(notification_digest_items).where(notification_digest_items.c.delivered_at < cutoff)
+            ).rowcount
+
+    @staticmethod
+    def format_digest(items: List[dict], weekly: bool = False) -> str:
+        """Merge a user's items into one message"""
+        profits = [item for item in items if item['kind'] == KIND_PROFIT]
+        completions = [item for item in items if item['kind'] == KIND_COMPLETION]
+        returns = [item for item in items if item['kind'] == KIND_RETURN]
+        profit_total = sum((Decimal(str(item['amount'])) for item in profits), Decimal('0'))
+        return_total = sum((Decimal(str(item['amount'])) for item in returns), Decimal('0'))
+
+        lines = [f"💰 <b>{'Weekly' if weekly else 'Daily'} Mining Report</b>", ""]
+        if profits:
+            days = len({item['created_at'].date() for item in profits})
+            period = f" over {days} days" if days > 1 else ""
+            lines.append(f"⛏️ Mining profit: <b>${profit_total:,.2f}</b>{period}")
+        for item in completions:
+            lines.append(f"🏁 Mining completed: {item['detail'] or 'plan'}")
+        if returns:
+            lines.append(f"💵 Investment returned: <b>${return_total:,.2f}</b>")
+        lines += ["", f"✅ Total credited: <b>${profit_total + return_total:,.2f}</b>"]
+        return "\n".join(lines)
+
+    async def _send(self, bot, telegram_id: int, text: str) -> str:
+        for _ in range(3):
+            try:
+                await bot.send_message(chat_id=telegram_id, text=text, parse_mode='HTML')
+                return SEND_OK
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except Forbidden:
+                return SEND_BLOCKED  # User blocked the bot; nothing to retry
+            except TelegramError as e:
+                logger.error(f"Error sending digest to {telegram_id}: {e}")
+                return SEND_FAILED
+        return SEND_FAILED
+
+    async def deliver(self, bot=None):
+        """Send every due digest, spread evenly over the delivery window"""
+        bot = bot or self.bot
+        await self._flush_async()
+        now = datetime.utcnow()
+        purged = await asyncio.to_thread(self.purge_delivered, now)
+        if purged:
+            logger.info(f"Purged {purged} delivered digest items older than {self.retention_days} days")
+        digests = await asyncio.to_thread(self._due_digests, now)
+        total = len(digests)
+        if not total:
+            # Keep the previous run's progress for /digest
+            logger.info("No digests due")
+            return self.progress
+        spacing = max(self.window_seconds / total, 1 / self.max_rate) if total else 0
+        self.progress = {
+            'total': total, SEND_OK: 0, SEND_BLOCKED: 0, SEND_FAILED: 0,
+            'started_at': now, 'finished_at': None, 'window_seconds': self.window_seconds
+        }
+        logger.info(f"Delivering {total} digests over {spacing * total:.0f}s")
+
+        next_send = time.monotonic()
+        for telegram_id, items in digests.items():
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_send = max(next_send + spacing, time.monotonic())
+
+            weekly = items[0]['digest_mode'] == DIGEST_WEEKLY
+            result = await self._send(bot, telegram_id, self.format_digest(items, weekly))
+            self.progress[result] += 1
+            if result != SEND_FAILED:
+                # Mark right away so a cancelled or restarted run does not send it again
+                await asyncio.to_thread(self._mark_delivered, [item['id'] for item in items], now)
+
+        self.progress['finished_at'] = datetime.utcnow()
+        logger.info(f"Digest delivery finished: {self.progress}")
+
+        if settings.SUPER_ADMIN_ID:
+            try:
+                await bot.send_message(chat_id=settings.SUPER_ADMIN_ID, text=self.status_text(), parse_mode='HTML')
+            except Exception as e:
+                logger.error(f"Error sending digest delivery summary: {e}")
+        return self.progress
+
+    def start_delivery(self, bot=None) -> bool:
+        """Persist the run's events and deliver digests in the background"""
+        loop = asyncio.get_running_loop()
+        if self._task and not self._task.done():
+            logger.warning("Digest delivery already running; new items go out in the next run")
+            self._flush_task = loop.create_task(self._flush_async())
+            return False
+        self._task = loop.create_task(self.deliver(bot))
+        return True
+
+    def status_text(self) -> str:
+        """Delivery progress for the admin panel"""
+        if not self.progress:
+            return "📬 <b>Digest Delivery</b>\n\nNo delivery has run yet."
+        progress = self.progress
+        done = progress[SEND_OK] + progress[SEND_BLOCKED] + progress[SEND_FAILED]
+        percent = done / progress['total'] * 100 if progress['total'] else 100
+        state = '✅ Finished' if progress['finished_at'] else '🔄 Sending'
+        return (
+            f"📬 <b>Digest Delivery</b>\n\n"
+            f"Status: {state}\n"
+            f"Progress: {done}/{progress['total']} ({percent:.0f}%)\n"
+            f"Sent: {progress[SEND_OK]} • Blocked: {progress[SEND_BLOCKED]} • Failed: {progress[SEND_FAILED]}\n"
+            f"Started: {progress['started_at']:%Y-%m-%d %H:%M} UTC\n"
+            f"Window: {progress['window_seconds'] / 60:.0f} min"
+        )
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+# Global notification digest instance
+notification_digest = NotificationDigest(
+    window_seconds=float(os.getenv('DIGEST_WINDOW_MINUTES', '60')) * 60,
+    retention_days=int(os.getenv('DIGEST_RETENTION_DAYS', '30'))
+)
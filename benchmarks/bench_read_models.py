@@ -0,0 +1,174 @@
+"""
+Queries and memory per update: ORM entities vs read-model DTOs
+
+Builds a synthetic SQLite database with the user-facing tables, then
+renders the dashboard, mining, wallet, transactions and referrals screens
+for a stream of users twice: once by loading ORM entities and walking
+their relationships, as the handlers do today, and once through
+UserReadModel. Reports SQL statements per update, wall time and the
+tracemalloc peak (Python allocations, not process RSS).
+
+Usage: python benchmarks/bench_read_models.py [users] [updates]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, ForeignKey, Integer, MetaData, Numeric, String, Table, create_engine
+)
+from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.orm import Session
+
+from services.read_models import UserReadModel
+from utils.query_budget import count_queries
+
+SCREENS = ('dashboard', 'mining', 'wallet', 'transactions', 'referrals')
+
+
+def build_database(users: int, seed: int = 11):
+    engine = create_engine('sqlite://')
+    metadata = MetaData()
+    Table('users', metadata,
+          Column('id', Integer, primary_key=True), Column('telegram_id', BigInteger, unique=True),
+          Column('username', String(50)), Column('first_name', String(50)),
+          Column('referral_code', String(20)), Column('created_at', DateTime))
+    Table('user_wallets', metadata,
+          Column('id', Integer, primary_key=True), Column('user_id', ForeignKey('users.id')),
+          Column('balance', Numeric(20, 8)), Column('total_deposited', Numeric(20, 8)),
+          Column('total_withdrawn', Numeric(20, 8)), Column('total_profit', Numeric(20, 8)))
+    Table('mining_levels', metadata,
+          Column('id', Integer, primary_key=True), Column('name', String(30)),
+          Column('daily_profit_rate', Numeric(5, 2)), Column('duration_days', Integer))
+    Table('user_mining', metadata,
+          Column('id', Integer, primary_key=True), Column('user_id', ForeignKey('users.id')),
+          Column('mining_level_id', ForeignKey('mining_levels.id')), Column('amount', Numeric(20, 8)),
+          Column('total_profit', Numeric(20, 8)), Column('status', String(20)),
+          Column('start_date', DateTime), Column('end_date', DateTime))
+    Table('transactions', metadata,
+          Column('id', Integer, primary_key=True), Column('user_id', ForeignKey('users.id')),
+          Column('type', String(20)), Column('amount', Numeric(20, 8)), Column('status', String(20)),
+          Column('description', String(255)), Column('created_at', DateTime))
+    Table('referrals', metadata,
+          Column('id', Integer, primary_key=True), Column('referrer_id', ForeignKey('users.id')),
+          Column('referred_id', Integer), Column('bonus_amount', Numeric(20, 8)))
+    metadata.create_all(engine)
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    t = metadata.tables
+    with engine.begin() as conn:
+        conn.execute(t['mining_levels'].insert(), [
+            {'id': i, 'name': name, 'daily_profit_rate': rate, 'duration_days': days}
+            for i, (name, rate, days) in enumerate(
+                [('Starter', 1.5, 30), ('Bronze', 2.0, 60), ('Silver', 2.5, 90),
+                 ('Gold', 3.0, 120), ('Platinum', 3.5, 180), ('Diamond', 4.0, 365)], start=1)
+        ])
+        conn.execute(t['users'].insert(), [
+            {'id': uid, 'telegram_id': 10_000 + uid, 'username': f"user{uid}", 'first_name': f"User {uid}",
+             'referral_code': f"REF{uid:06d}", 'created_at': now}
+            for uid in range(1, users + 1)
+        ])
+        conn.execute(t['user_wallets'].insert(), [
+            {'user_id': uid, 'balance': Decimal('125.5'), 'total_deposited': Decimal('500'),
+             'total_withdrawn': Decimal('50'), 'total_profit': Decimal('75.5')}
+            for uid in range(1, users + 1)
+        ])
+        conn.execute(t['user_mining'].insert(), [
+            {'user_id': uid, 'mining_level_id': rng.randint(1, 6), 'amount': Decimal(rng.randint(10, 5000)),
+             'total_profit': Decimal('12.5'), 'status': rng.choice(['active', 'active', 'completed']),
+             'start_date': now - timedelta(days=rng.randint(1, 60)), 'end_date': now + timedelta(days=30)}
+            for uid in range(1, users + 1) for _ in range(rng.randint(1, 4))
+        ])
+        conn.execute(t['transactions'].insert(), [
+            {'user_id': uid, 'type': rng.choice(['deposit', 'profit', 'withdrawal']),
+             'amount': Decimal(rng.randint(1, 500)), 'status': 'completed',
+             'description': 'x' * 120, 'created_at': now - timedelta(hours=rng.randint(1, 2000))}
+            for uid in range(1, users + 1) for _ in range(rng.randint(20, 80))
+        ])
+        conn.execute(t['referrals'].insert(), [
+            {'referrer_id': uid, 'referred_id': rng.randint(1, users), 'bonus_amount': Decimal('5')}
+            for uid in range(1, users + 1) for _ in range(rng.randint(0, 5))
+        ])
+    return engine
+
+
+def orm_screen(session: Session, models, screen: str, telegram_id: int):
+    """Load entities and walk relationships the way the handlers format screens"""
+    user = session.query(models.users).filter_by(telegram_id=telegram_id).one()
+    if screen in ('dashboard', 'wallet'):
+        wallet = user.user_wallets_collection[0]
+        result = [wallet.balance, wallet.total_profit]
+        if screen == 'dashboard':
+            result += [m.amount for m in user.user_mining_collection if m.status == 'active']
+        return result
+    if screen == 'mining':
+        return [(m.mining_levels.name, m.amount) for m in user.user_mining_collection if m.status == 'active']
+    if screen == 'transactions':
+        transactions = (
+            session.query(models.transactions)
+            .filter_by(user_id=user.id)
+            .order_by(models.transactions.created_at.desc())
+            .limit(10)
+        )
+        return [(tx.type, tx.amount) for tx in transactions]
+    return [user.referral_code, len(user.referrals_collection),
+            sum(r.bonus_amount for r in user.referrals_collection)]
+
+
+def dto_screen(read_model: UserReadModel, screen: str, telegram_id: int):
+    if screen == 'dashboard':
+        return read_model.dashboard(telegram_id)
+    if screen == 'mining':
+        return read_model.active_mining(telegram_id)
+    if screen == 'wallet':
+        return read_model.wallet(telegram_id)
+    if screen == 'transactions':
+        return read_model.recent_transactions(telegram_id)
+    return read_model.referrals(telegram_id)
+
+
+def measure(label: str, render, workload):
+    tracemalloc.start()
+    started = time.perf_counter()
+    with count_queries() as counter:
+        for screen, telegram_id in workload:
+            render(screen, telegram_id)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10}{counter.count / len(workload):>14.2f}{elapsed / len(workload) * 1000:>12.2f}"
+          f"{peak / 1024:>17.0f}")
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    engine = build_database(users)
+
+    Base = automap_base()
+    Base.prepare(autoload_with=engine)
+    read_model = UserReadModel(engine).prepare()
+
+    rng = random.Random(3)
+    workload = [(rng.choice(SCREENS), 10_000 + rng.randint(1, users)) for _ in range(updates)]
+
+    def orm_render(screen, telegram_id):
+        # One session per update, as each handler call opens its own
+        with Session(engine) as session:
+            orm_screen(session, Base.classes, screen, telegram_id)
+
+    print(f"{updates} updates over {users} users")
+    print(f"{'path':<10}{'queries/update':>14}{'ms/update':>12}{'traced peak KiB':>17}")
+    measure('orm', orm_render, workload)
+    measure('dto', lambda screen, telegram_id: dto_screen(read_model, screen, telegram_id), workload)
+
+
+if __name__ == '__main__':
+    main()
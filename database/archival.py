@@ -0,0 +1,367 @@
+"""
+Hot/cold storage lifecycle for transactions, mining_profits and user_mining
+
+Closed monthly periods are exported to gzip-compressed JSON Lines files,
+summarised per user into ``<table>_monthly_summary`` and removed from the
+hot table. Only rows in a final status are archived; pending deposits and
+withdrawals stay hot however old they are. On PostgreSQL, tables declared
+``PARTITION BY RANGE`` get one partition per month and archived periods
+are detached instead of deleted row by row once nothing unfinished is left
+in them. Archived detail can be rehydrated on demand.
+
+Hashes of archived completed transactions are copied to
+``credited_tx_hashes`` before the rows leave the hot table, so a credited
+deposit's tx hash can still be refused after archival.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import (
+    Column, Date, DateTime, Integer, MetaData, Numeric, String, Table,
+    create_engine, delete, func, select, text
+)
+from sqlalchemy.engine import Engine
+
+from config.settings import settings
+from database import credited_hashes
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivePolicy(NamedTuple):
+    """How one hot table is split into periods and summarised
+
+    With a ``status_column`` only rows whose status is in ``final_statuses``
+    are archived, and the status becomes part of the summary group key.
+    """
+    table: str
+    date_column: str
+    amount_column: str = 'amount'
+    group_column: Optional[str] = None
+    status_column: Optional[str] = None
+    final_statuses: Tuple[str, ...] = ()
+
+
+FINAL_TRANSACTION_STATUSES = ('completed', 'failed', 'rejected', 'cancelled')
+
+DEFAULT_POLICIES = (
+    ArchivePolicy('transactions', 'created_at', 'amount', 'type', 'status', FINAL_TRANSACTION_STATUSES),
+    ArchivePolicy('mining_profits', 'created_at', 'profit_amount'),
+    ArchivePolicy('user_mining', 'end_date', 'amount', 'mining_level_id', 'status', ('completed',)),
+)
+
+
+def month_bounds(period: str) -> Tuple[datetime, datetime]:
+    """Return [start, end) datetimes for a 'YYYY-MM' period"""
+    start = datetime.strptime(period, '%Y-%m')
+    end = datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+    return start, end
+
+
+def shift_month(day: date, months: int) -> str:
+    """Return the 'YYYY-MM' period ``months`` away from ``day``"""
+    index = day.year * 12 + day.month - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode(column: Column, value):
+    if value is None:
+        return None
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Date):
+        return date.fromisoformat(value)
+    if isinstance(column.type, Numeric) and column.type.asdecimal:
+        return Decimal(value)
+    return value
+
+
+class DataLifecycleManager:
+    """Moves closed periods of growing tables into compressed cold storage"""
+
+    def __init__(self, engine: Optional[Engine] = None, archive_path: str = 'archives',
+                 hot_months: int = 3, policies=DEFAULT_POLICIES):
+        self._engine = engine
+        self.archive_path = archive_path
+        self.hot_months = hot_months
+        self.policies = {policy.table: policy for policy in policies}
+        self.metadata = MetaData()
+        self._created: set = set()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(settings.DATABASE_URL)
+        return self._engine
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.engine.dialect.name == 'postgresql'
+
+    def _table(self, name: str) -> Table:
+        if name not in self.metadata.tables:
+            Table(name, self.metadata, autoload_with=self.engine)
+        return self.metadata.tables[name]
+
+    def _summary_table(self, policy: ArchivePolicy) -> Table:
+        name = f"{policy.table}_monthly_summary"
+        if name not in self.metadata.tables:
+            Table(
+                name, self.metadata,
+                Column('user_id', Integer, primary_key=True),
+                Column('period', String(7), primary_key=True),
+                Column('group_key', String(50), primary_key=True, default=''),
+                Column('row_count', Integer, nullable=False),
+                Column('total_amount', Numeric(20, 8), nullable=False),
+            )
+        table = self.metadata.tables[name]
+        if name not in self._created:
+            table.create(self.engine, checkfirst=True)
+            self._created.add(name)
+        return table
+
+    @staticmethod
+    def _group_key(policy: ArchivePolicy, record: dict) -> str:
+        parts = [record[column] for column in (policy.group_column, policy.status_column) if column]
+        return ':'.join(str(part) for part in parts)
+
+    def _archivable(self, policy: ArchivePolicy, hot: Table):
+        """Filter for rows that may leave the hot table, or None for all rows"""
+        if not policy.status_column:
+            return None
+        return hot.c[policy.status_column].in_(policy.final_statuses)
+
+    def _archive_file(self, table: str, period: str) -> str:
+        return os.path.join(self.archive_path, table, f"{period}.jsonl.gz")
+
+    def _is_partitioned(self, table: str) -> bool:
+        if not self.is_postgres:
+            return False
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                     "WHERE c.relname = :name"),
+                {'name': table}
+            ).first() is not None
+
+    def ensure_partitions(self, months_ahead: int = 2) -> List[str]:
+        """Create monthly partitions for partitioned PostgreSQL tables"""
+        created = []
+        today = date.today()
+        for policy in self.policies.values():
+            if not self._is_partitioned(policy.table):
+                continue
+            with self.engine.begin() as conn:
+                # Hot months only: the newest closed month is archived and must stay dropped
+                for offset in range(-self.hot_months + 1, months_ahead + 1):
+                    period = shift_month(today, offset)
+                    start, end = month_bounds(period)
+                    partition = f"{policy.table}_{period.replace('-', '_')}"
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {policy.table} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    ))
+                    created.append(partition)
+        return created
+
+    def closed_periods(self, table: str) -> List[str]:
+        """Periods older than the hot window that still have archivable rows in the hot table"""
+        policy = self.policies[table]
+        hot = self._table(table)
+        date_column = hot.c[policy.date_column]
+        cutoff, _ = month_bounds(shift_month(date.today(), -self.hot_months + 1))
+
+        statement = select(func.min(date_column))
+        archivable = self._archivable(policy, hot)
+        if archivable is not None:
+            statement = statement.where(archivable)
+        with self.engine.connect() as conn:
+            oldest = conn.execute(statement).scalar()
+        if oldest is None:
+            return []
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+
+        periods, period = [], oldest.strftime('%Y-%m')
+        while month_bounds(period)[0] < cutoff:
+            periods.append(period)
+            period = shift_month(month_bounds(period)[0].date(), 1)
+        return periods
+
+    def archive_period(self, table: str, period: str) -> int:
+        """Export, summarise and remove one closed period; returns rows archived"""
+        policy = self.policies[table]
+        hot = self._table(table)
+        summary = self._summary_table(policy)
+        start, end = month_bounds(period)
+        in_period = (hot.c[policy.date_column] >= start) & (hot.c[policy.date_column] < end)
+        archivable = self._archivable(policy, hot)
+        to_archive = in_period if archivable is None else in_period & archivable
+
+        path = self._archive_file(table, period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        key_column = hot.primary_key.columns[0].name
+        totals: Dict[tuple, list] = {}
+        archived_keys = set()
+        tx_hashes: Dict[str, int] = {}
+        if 'tx_hash' in hot.c:
+            credited_hashes.metadata.create_all(self.engine)
+
+        with self.engine.begin() as conn:
+            rows = conn.execute(select(hot).where(to_archive)).mappings()
+            with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as archive:
+                for row in rows:
+                    archive.write(json.dumps({key: _encode(value) for key, value in row.items()}) + '\n')
+                    archived_keys.add(row[key_column])
+                    if row.get('tx_hash') and row.get('status', 'completed') == 'completed':
+                        tx_hashes[row['tx_hash']] = row[key_column]
+
+                # Carry over earlier exports of this period, skipping rehydrated duplicates
+                for record in self._read_records(path):
+                    if record.get(key_column) not in archived_keys:
+                        archive.write(json.dumps(record) + '\n')
+
+            if not archived_keys:
+                os.remove(path + '.tmp')
+                return 0
+
+            for record in self._read_records(path + '.tmp'):
+                group = self._group_key(policy, record)
+                bucket = totals.setdefault((record['user_id'], group), [0, Decimal('0')])
+                bucket[0] += 1
+                bucket[1] += Decimal(str(record[policy.amount_column] or 0))
+
+            # Keep credited hashes checkable once their transactions leave the hot table
+            already = credited_hashes.credited(conn, tx_hashes)
+            missing = [{'tx_hash': tx_hash, 'transaction_id': transaction_id, 'credited_at': datetime.utcnow()}
+                       for tx_hash, transaction_id in tx_hashes.items() if tx_hash not in already]
+            if missing:
+                conn.execute(credited_hashes.credited_tx_hashes.insert(), missing)
+
+            conn.execute(delete(summary).where(summary.c.period == period))
+            conn.execute(summary.insert(), [
+                {'user_id': user_id, 'period': period, 'group_key': group,
+                 'row_count': count, 'total_amount': amount}
+                for (user_id, group), (count, amount) in totals.items()
+            ])
+
+            partition = f"{table}_{period.replace('-', '_')}"
+            unfinished = 0
+            if archivable is not None:
+                unfinished = conn.execute(
+                    select(func.count()).select_from(hot).where(in_period & ~archivable)
+                ).scalar()
+            if self._is_partitioned(table) and not unfinished:
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                conn.execute(text(f"DROP TABLE {partition}"))
+            else:
+                conn.execute(delete(hot).where(to_archive))
+
+            os.replace(path + '.tmp', path)
+
+        archived = len(archived_keys)
+        logger.info(f"Archived {archived} rows of {table} for {period} to {path}"
+                    + (f", {unfinished} unfinished rows kept hot" if unfinished else ""))
+        return archived
+
+    def run(self) -> Dict[str, int]:
+        """Archive every closed period of every managed table"""
+        results = {}
+        if self.is_postgres:
+            try:
+                self.ensure_partitions()
+            except Exception as e:
+                logger.error(f"Error creating partitions: {e}")
+        for table in self.policies:
+            try:
+                results[table] = sum(self.archive_period(table, period) for period in self.closed_periods(table))
+            except Exception as e:
+                logger.error(f"Error archiving {table}: {e}")
+                results[table] = 0
+        return results
+
+    def user_summary(self, table: str, user_id: int) -> List[dict]:
+        """Per-period totals for a user's archived history"""
+        summary = self._summary_table(self.policies[table])
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(summary).where(summary.c.user_id == user_id).order_by(summary.c.period.desc())
+            ).mappings()
+            return [dict(row) for row in rows]
+
+    def archived_periods(self, table: str) -> List[str]:
+        """Periods available in cold storage for a table"""
+        directory = os.path.join(self.archive_path, table)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:7] for name in os.listdir(directory) if name.endswith('.jsonl.gz'))
+
+    @staticmethod
+    def _read_records(path: str) -> Iterator[dict]:
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                yield json.loads(line)
+
+    def iter_archived(self, table: str, period: str, user_id: Optional[int] = None) -> Iterator[dict]:
+        """Stream archived rows for a period, optionally for one user"""
+        hot = self._table(table)
+        for record in self._read_records(self._archive_file(table, period)):
+            if user_id is not None and record.get('user_id') != user_id:
+                continue
+            yield {key: _decode(hot.c[key], value) if key in hot.c else value
+                   for key, value in record.items()}
+
+    def rehydrate(self, table: str, period: str, user_id: Optional[int] = None, restore: bool = False) -> List[dict]:
+        """Load archived detail; with ``restore`` the rows are put back into the hot table
+
+        Restoring drops the period's summary rows for the restored users, so
+        the restored detail is not counted twice; the next archive run
+        rebuilds them.
+        """
+        rows = list(self.iter_archived(table, period, user_id))
+        if restore and rows:
+            if self._is_partitioned(table):
+                self.ensure_partitions()
+                start, end = month_bounds(period)
+                with self.engine.begin() as conn:
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {table}_{period.replace('-', '_')} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    ))
+            hot = self._table(table)
+            summary = self._summary_table(self.policies[table])
+            with self.engine.begin() as conn:
+                existing = {pk for (pk,) in conn.execute(
+                    select(hot.primary_key.columns[0]).where(
+                        hot.primary_key.columns[0].in_([row[hot.primary_key.columns[0].name] for row in rows])
+                    )
+                )}
+                missing = [row for row in rows if row[hot.primary_key.columns[0].name] not in existing]
+                if missing:
+                    conn.execute(hot.insert(), missing)
+
+                restored_users = sorted({row['user_id'] for row in rows})
+                conn.execute(delete(summary).where(
+                    (summary.c.period == period) & summary.c.user_id.in_(restored_users)
+                ))
+            logger.info(f"Rehydrated {len(missing)} rows of {table} for {period}")
+        return rows
+
+
+# Global data lifecycle manager instance
+data_lifecycle = DataLifecycleManager()
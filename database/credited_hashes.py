@@ -0,0 +1,47 @@
+"""
+Ledger of on-chain transaction hashes that have been credited
+
+Deposit tx hashes are public, so a hash may only ever be credited once.
+The ``transactions`` rows that carry them are archived after a few
+months, so the hashes are also kept here, in a table archival never
+touches. The approval path records the hash in the same database
+transaction as the credit; the unique constraint refuses a second credit.
+"""
+from datetime import datetime
+from typing import Iterable, Set
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+metadata = MetaData()
+
+credited_tx_hashes = Table(
+    'credited_tx_hashes', metadata,
+    Column('tx_hash', String(128), primary_key=True),
+    Column('transaction_id', Integer, nullable=False),
+    Column('credited_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def record_credit(conn: Connection, tx_hash: str, transaction_id: int) -> bool:
+    """Claim a hash inside the caller's transaction; False if it was already credited"""
+    try:
+        with conn.begin_nested():
+            conn.execute(credited_tx_hashes.insert().values(
+                tx_hash=tx_hash, transaction_id=transaction_id, credited_at=datetime.utcnow()
+            ))
+        return True
+    except IntegrityError:
+        return False
+
+
+def credited(conn: Connection, tx_hashes: Iterable[str]) -> Set[str]:
+    """The subset of ``tx_hashes`` that has already been credited"""
+    tx_hashes = list(dict.fromkeys(tx_hashes))
+    found = set()
+    for i in range(0, len(tx_hashes), 500):
+        found.update(conn.execute(
+            select(credited_tx_hashes.c.tx_hash).where(credited_tx_hashes.c.tx_hash.in_(tx_hashes[i:i + 500]))
+        ).scalars())
+    return found
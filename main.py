@@ -3,6 +3,8 @@ Main Telegram bot application for USDT Mining Platform
 """
 import logging
 import asyncio
+import io
+import time
 from telegram import Update
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
@@ -16,9 +18,17 @@ from handlers.admin_handlers import (
     WAITING_FOR_REJECTION_REASON
 )
 from automation.profit_scheduler import profit_scheduler
+from automation.deposit_verifier import deposit_verifier
+from automation.notification_digest import notification_digest, DIGEST_MODES
+from services.read_models import user_read_model
 from utils.security import rate_limiter
+from utils.lifecycle import graceful_lifecycle
+from utils.profiling import run_cprofile, sampling_profiler, slow_update_recorder
+from utils.concurrency import PerUserUpdateProcessor
+from utils.watchdog import loop_watchdog
 import sys
 import os
+import platform
 
 # Configure logging
 logging.basicConfig(
@@ -38,6 +48,7 @@ class MiningBot:
     def __init__(self):
         self.application = None
         self.is_running = False
+        self.profile_task = None
     
     def setup_handlers(self):
         """Setup all bot handlers"""
@@ -92,6 +103,10 @@ class MiningBot:
             # Command handlers
             self.application.add_handler(CommandHandler('start', UserHandlers.start_command))
             self.application.add_handler(CommandHandler('admin', AdminHandlers.admin_command))
+            self.application.add_handler(CommandHandler('notifications', self.notifications_command))
+            self.application.add_handler(CommandHandler('digest', self.digest_command))
+            self.application.add_handler(CommandHandler('profile', self.profile_command))
+            self.application.add_handler(CommandHandler('slowlog', self.slowlog_command))
             
             # User callback handlers
             self.application.add_handler(CallbackQueryHandler(
@@ -174,6 +189,127 @@ class MiningBot:
             logger.error(f"Error setting up handlers: {e}")
             raise
     
+    @staticmethod
+    def _is_super_admin(update: Update) -> bool:
+        return bool(update.effective_user) and str(update.effective_user.id) == str(settings.SUPER_ADMIN_ID)
+    
+    async def notifications_command(self, update: Update, context):
+        """Choose how profit notifications arrive: /notifications [daily|weekly|mute]"""
+        try:
+            user_id = update.effective_user.id
+            args = context.args or []
+            
+            if args:
+                mode = args[0].lower()
+                if mode not in DIGEST_MODES:
+                    await update.message.reply_text("❌ Use /notifications daily, weekly or mute.")
+                    return
+                await asyncio.to_thread(notification_digest.set_mode, user_id, mode)
+            else:
+                mode = await asyncio.to_thread(notification_digest.get_mode, user_id)
+            
+            descriptions = {
+                'daily': '📅 One summary after each daily profit run',
+                'weekly': '🗓️ One summary per week',
+                'mute': '🔕 No profit notifications'
+            }
+            await update.message.reply_text(
+                f"🔔 <b>Profit Notifications</b>\n\n"
+                f"Current: <b>{mode}</b>\n{descriptions[mode]}\n\n"
+                f"Change with /notifications daily, weekly or mute.",
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.error(f"Error in notifications command: {e}")
+    
+    async def digest_command(self, update: Update, context):
+        """Show profit digest delivery progress"""
+        try:
+            if not self._is_super_admin(update):
+                return
+            await update.message.reply_text(notification_digest.status_text(), parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Error in digest command: {e}")
+    
+    async def profile_command(self, update: Update, context):
+        """Profile the bot for N seconds: /profile [seconds] [sample|cprofile]"""
+        try:
+            if not self._is_super_admin(update):
+                return
+            
+            # Arguments are read by kind, so "/profile cprofile" and "/profile 60 sample" both work
+            seconds, mode = 30, 'sample'
+            for arg in context.args or []:
+                if arg.isdigit():
+                    seconds = min(max(int(arg), 1), 300)
+                elif arg.lower() in ('sample', 'cprofile'):
+                    mode = arg.lower()
+                else:
+                    await update.message.reply_text(
+                        "❌ Usage: /profile [seconds] [sample|cprofile]"
+                    )
+                    return
+            if self.profile_task and not self.profile_task.done():
+                await update.message.reply_text("⏳ A profiling session is already running.")
+                return
+            
+            await update.message.reply_text(f"🔬 Profiling for {seconds}s ({mode})...")
+            # Not an application task, so Application.stop() does not wait for it;
+            # post_shutdown cancels it instead
+            self.profile_task = asyncio.create_task(
+                self._run_profile(context.bot, update.effective_chat.id, seconds, mode)
+            )
+        except Exception as e:
+            logger.error(f"Error in profile command: {e}")
+    
+    async def _run_profile(self, bot, chat_id: int, seconds: int, mode: str):
+        """Run a profiling session and send the result as a document"""
+        try:
+            if mode == 'cprofile':
+                data = await run_cprofile(seconds)
+                filename = f"profile_{int(time.time())}.txt"
+            else:
+                data = await sampling_profiler.profile(seconds)
+                filename = f"profile_{int(time.time())}.collapsed"
+            
+            await bot.send_document(
+                chat_id=chat_id,
+                document=io.BytesIO(data),
+                filename=filename,
+                caption=f"🔬 {mode} profile, {seconds}s"
+            )
+        except Exception as e:
+            logger.error(f"Error running profiler: {e}")
+    
+    async def slowlog_command(self, update: Update, context):
+        """Control slow-update capture: /slowlog [on [ms]|off]"""
+        try:
+            if not self._is_super_admin(update):
+                return
+            
+            args = context.args or []
+            action = args[0].lower() if args else ''
+            if action == 'on':
+                threshold = float(args[1]) if len(args) > 1 and args[1].replace('.', '', 1).isdigit() else None
+                slow_update_recorder.enable(threshold)
+            elif action == 'off':
+                slow_update_recorder.disable()
+            
+            status = '✅ On' if slow_update_recorder.enabled else '⏹️ Off'
+            await update.message.reply_text(
+                f"🐢 Slow update capture: {status}\n"
+                f"Threshold: {slow_update_recorder.threshold_ms:.0f}ms\n"
+                f"Captured: {len(slow_update_recorder.records)}"
+            )
+            
+            if not action and slow_update_recorder.records:
+                await update.message.reply_document(
+                    document=io.BytesIO(slow_update_recorder.dump()),
+                    filename=f"slow_updates_{int(time.time())}.jsonl"
+                )
+        except Exception as e:
+            logger.error(f"Error in slowlog command: {e}")
+    
     async def handle_unknown_callback(self, update: Update, context):
         """Handle unknown callback queries"""
         try:
@@ -207,10 +343,32 @@ class MiningBot:
             # Initialize database
             initialize_database()
             
+            # Reflect read-model tables once, so screens only run their own query
+            await asyncio.to_thread(user_read_model.prepare)
+            
             # Start profit scheduler
             profit_scheduler.bot = application.bot
             profit_scheduler.start()
             
+            # Profit digests are sent by the scheduler's bot
+            notification_digest.bot = application.bot
+            
+            # Start deposit verifier; it stays off until pending_loader and
+            # approver are assigned from the deposit service
+            deposit_verifier.bot = application.bot
+            deposit_verifier.start()
+            
+            # Watch for handlers and jobs blocking the event loop
+            loop_watchdog.register_application(application)
+            loop_watchdog.register(deposit_verifier.run_once, 'deposit_verifier.run_once')
+            loop_watchdog.register(notification_digest.deliver, 'notification_digest.deliver')
+            loop_watchdog.start()
+            
+            # Hand graceful shutdown the stop signals and resume from the last process
+            if platform.system() != 'Windows':
+                graceful_lifecycle.install_signal_handlers()
+            await graceful_lifecycle.replay_pending()
+            
             # Send startup notification to super admin
             if settings.SUPER_ADMIN_ID:
                 try:
@@ -249,6 +407,19 @@ The mining bot is fully operational.
             # Stop profit scheduler
             profit_scheduler.stop()
             
+            # Stop deposit verifier and any digest delivery in progress
+            deposit_verifier.stop()
+            notification_digest.stop()
+            
+            # Cancel a running profiling session
+            if self.profile_task:
+                self.profile_task.cancel()
+                self.profile_task = None
+            
+            # Stop loop watchdog
+            logger.info(f"Loop watchdog: {loop_watchdog.snapshot()}")
+            loop_watchdog.stop()
+            
             # Send shutdown notification to super admin
             if settings.SUPER_ADMIN_ID:
                 try:
@@ -288,10 +459,22 @@ The bot will be back online shortly.
                 raise ValueError("BOT_TOKEN is required")
             
             # Create application
-            self.application = Application.builder().token(settings.BOT_TOKEN).build()
+            self.application = (
+                Application.builder()
+                .token(settings.BOT_TOKEN)
+                .concurrent_updates(PerUserUpdateProcessor(
+                    slow_update_recorder,
+                    max_concurrent_updates=int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
+                ))
+                .build()
+            )
             
             # Setup handlers
             self.setup_handlers()
+            graceful_lifecycle.attach(self.application)
+            slow_update_recorder.instrument(self.application)
+            if os.getenv('SLOW_UPDATE_CAPTURE', '').lower() in ('1', 'true', 'yes'):
+                slow_update_recorder.enable()
             
             # Set post init and shutdown hooks
             self.application.post_init = self.post_init
@@ -300,10 +483,14 @@ The bot will be back online shortly.
             logger.info(f"Starting {settings.APP_NAME}...")
             logger.info(f"Bot username: @{settings.BOT_USERNAME}")
             
-            # Run the bot
+            # Run the bot, keeping updates that arrived while restarting
+            run_kwargs = {}
+            if platform.system() != 'Windows':
+                run_kwargs['stop_signals'] = None
             self.application.run_polling(
                 allowed_updates=Update.ALL_TYPES,
-                drop_pending_updates=True
+                drop_pending_updates=False,
+                **run_kwargs
             )
             
         except Exception as e:
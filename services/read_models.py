@@ -0,0 +1,215 @@
+"""
+Read models for user-facing screens
+
+Each screen is served by one column-projected query that returns compact
+NamedTuple DTOs instead of ORM entities, so rendering a screen does not
+pay for identity-map bookkeeping, lazy-load round trips or full rows.
+Writes still go through the ORM services. ``prepare()`` reflects the
+tables once at startup, so screen calls only ever run their own query.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import MetaData, Table, and_, create_engine, func, select
+from sqlalchemy.engine import Engine
+
+from config.settings import settings
+
+ACTIVE_MINING_STATUS = 'active'
+
+
+class WalletView(NamedTuple):
+    balance: Decimal
+    total_deposited: Decimal
+    total_withdrawn: Decimal
+    total_profit: Decimal
+
+
+class DashboardView(NamedTuple):
+    user_id: int
+    telegram_id: int
+    first_name: Optional[str]
+    username: Optional[str]
+    wallet: WalletView
+    active_mining_count: int
+    active_mining_amount: Decimal
+
+
+class MiningPositionView(NamedTuple):
+    mining_id: int
+    level_name: str
+    daily_profit_rate: Decimal
+    amount: Decimal
+    total_profit: Decimal
+    start_date: Optional[datetime]
+    end_date: Optional[datetime]
+
+
+class TransactionView(NamedTuple):
+    transaction_id: int
+    type: str
+    amount: Decimal
+    status: str
+    created_at: datetime
+
+
+class ReferralView(NamedTuple):
+    referral_code: Optional[str]
+    referral_count: int
+    total_bonus: Decimal
+
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+class UserReadModel:
+    """Single-query, DTO-returning reads for the screens in UserHandlers"""
+
+    TABLES = ('users', 'user_wallets', 'mining_levels', 'user_mining', 'transactions', 'referrals')
+
+    def __init__(self, engine: Optional[Engine] = None):
+        self._engine = engine
+        self.metadata = MetaData()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(settings.DATABASE_URL)
+        return self._engine
+
+    def prepare(self) -> 'UserReadModel':
+        """Reflect the screen tables; call once at startup, before serving screens"""
+        if not self.metadata.tables:
+            self.metadata.reflect(self.engine, only=self.TABLES)
+        return self
+
+    def _t(self, name: str) -> Table:
+        if not self.metadata.tables:
+            raise RuntimeError("UserReadModel.prepare() must be called before reading screens")
+        return self.metadata.tables[name]
+
+    def dashboard(self, telegram_id: int) -> Optional[DashboardView]:
+        """User, wallet and active mining totals in one query"""
+        engine = self.engine
+        users, wallets, mining = self._t('users'), self._t('user_wallets'), self._t('user_mining')
+
+        active = (
+            select(
+                mining.c.user_id,
+                func.count().label('active_count'),
+                func.coalesce(func.sum(mining.c.amount), 0).label('active_amount')
+            )
+            .where(mining.c.status == ACTIVE_MINING_STATUS)
+            .group_by(mining.c.user_id)
+            .subquery()
+        )
+        statement = (
+            select(
+                users.c.id, users.c.telegram_id, users.c.first_name, users.c.username,
+                wallets.c.balance, wallets.c.total_deposited, wallets.c.total_withdrawn, wallets.c.total_profit,
+                active.c.active_count, active.c.active_amount
+            )
+            .select_from(
+                users.outerjoin(wallets, wallets.c.user_id == users.c.id)
+                .outerjoin(active, active.c.user_id == users.c.id)
+            )
+            .where(users.c.telegram_id == telegram_id)
+        )
+        with engine.connect() as conn:
+            row = conn.execute(statement).first()
+        if row is None:
+            return None
+        return DashboardView(
+            user_id=row.id,
+            telegram_id=row.telegram_id,
+            first_name=row.first_name,
+            username=row.username,
+            wallet=WalletView(
+                _decimal(row.balance), _decimal(row.total_deposited),
+                _decimal(row.total_withdrawn), _decimal(row.total_profit)
+            ),
+            active_mining_count=row.active_count or 0,
+            active_mining_amount=_decimal(row.active_amount)
+        )
+
+    def wallet(self, telegram_id: int) -> Optional[WalletView]:
+        """Wallet balances in one query"""
+        engine = self.engine
+        users, wallets = self._t('users'), self._t('user_wallets')
+        statement = (
+            select(wallets.c.balance, wallets.c.total_deposited, wallets.c.total_withdrawn, wallets.c.total_profit)
+            .join(users, wallets.c.user_id == users.c.id)
+            .where(users.c.telegram_id == telegram_id)
+        )
+        with engine.connect() as conn:
+            row = conn.execute(statement).first()
+        return WalletView(*(_decimal(value) for value in row)) if row else None
+
+    def active_mining(self, telegram_id: int) -> List[MiningPositionView]:
+        """Active mining positions with their level details in one query"""
+        engine = self.engine
+        users, mining, levels = self._t('users'), self._t('user_mining'), self._t('mining_levels')
+        statement = (
+            select(
+                mining.c.id, levels.c.name, levels.c.daily_profit_rate,
+                mining.c.amount, mining.c.total_profit, mining.c.start_date, mining.c.end_date
+            )
+            .select_from(
+                mining.join(users, mining.c.user_id == users.c.id)
+                .join(levels, mining.c.mining_level_id == levels.c.id)
+            )
+            .where(and_(users.c.telegram_id == telegram_id, mining.c.status == ACTIVE_MINING_STATUS))
+            .order_by(mining.c.start_date.desc())
+        )
+        with engine.connect() as conn:
+            return [
+                MiningPositionView(
+                    row.id, row.name, _decimal(row.daily_profit_rate), _decimal(row.amount),
+                    _decimal(row.total_profit), row.start_date, row.end_date
+                )
+                for row in conn.execute(statement)
+            ]
+
+    def recent_transactions(self, telegram_id: int, limit: int = 10) -> List[TransactionView]:
+        """Latest transactions in one query"""
+        engine = self.engine
+        users, transactions = self._t('users'), self._t('transactions')
+        statement = (
+            select(
+                transactions.c.id, transactions.c.type, transactions.c.amount,
+                transactions.c.status, transactions.c.created_at
+            )
+            .join(users, transactions.c.user_id == users.c.id)
+            .where(users.c.telegram_id == telegram_id)
+            .order_by(transactions.c.created_at.desc())
+            .limit(limit)
+        )
+        with engine.connect() as conn:
+            return [
+                TransactionView(row.id, row.type, _decimal(row.amount), row.status, row.created_at)
+                for row in conn.execute(statement)
+            ]
+
+    def referrals(self, telegram_id: int) -> Optional[ReferralView]:
+        """Referral code, count and bonus total in one query"""
+        engine = self.engine
+        users, referrals = self._t('users'), self._t('referrals')
+        statement = (
+            select(
+                users.c.referral_code,
+                func.count(referrals.c.referred_id).label('referral_count'),
+                func.coalesce(func.sum(referrals.c.bonus_amount), 0).label('total_bonus')
+            )
+            .select_from(users.outerjoin(referrals, referrals.c.referrer_id == users.c.id))
+            .where(users.c.telegram_id == telegram_id)
+            .group_by(users.c.id, users.c.referral_code)
+        )
+        with engine.connect() as conn:
+            row = conn.execute(statement).first()
+        return ReferralView(row.referral_code, row.referral_count, _decimal(row.total_bonus)) if row else None
+
+
+# Global read model instance
+user_read_model = UserReadModel()
@@ -15,6 +15,7 @@ def create_directories():
         'uploads/kyc',
         'uploads/temp',
         'backups',
+        'archives',
         'config'
     ]
     
@@ -199,6 +200,12 @@ if [ -d "logs" ]; then
     echo "✅ Logs backed up"
 fi
 
+# Backup archived transactions and profits
+if [ -d "archives" ]; then
+    tar -cf "$BACKUP_DIR/archives_$DATE.tar" archives/
+    echo "✅ Archives backed up"
+fi
+
 # Backup uploads
 if [ -d "uploads" ]; then
     tar -czf "$BACKUP_DIR/uploads_$DATE.tar.gz" uploads/
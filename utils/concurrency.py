@@ -0,0 +1,99 @@
+"""
+Concurrent update processing with per-user ordering
+
+Updates from different users run in parallel up to
+``max_concurrent_updates``; updates from the same user (or the same chat,
+for updates without a user) wait on a per-key lock so handlers and
+ConversationHandler states see them strictly in arrival order. A user's
+lock is taken before a concurrency slot, so one busy user cannot fill the
+slots with waiting updates, and it is evicted as soon as that user has
+nothing in flight.
+
+PTB hands every update to the processor as soon as it is fetched, so
+updates waiting for a lock or slot are no longer in ``update_queue``. The
+processor keeps them until their handler starts, and ``release_waiting()``
+returns them so a shutdown can hand them to the next process.
+"""
+import asyncio
+from typing import Awaitable, Dict, Hashable, List, Optional
+
+from telegram import Update
+
+from utils.profiling import ProfilingUpdateProcessor, SlowUpdateRecorder
+
+
+class _KeyLock:
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class PerUserUpdateProcessor(ProfilingUpdateProcessor):
+    """Processes updates concurrently while keeping each user's updates in order"""
+
+    def __init__(self, recorder: SlowUpdateRecorder, max_concurrent_updates: int = 16):
+        super().__init__(recorder, max_concurrent_updates)
+        self._locks: Dict[Hashable, _KeyLock] = {}
+        self._waiting: Dict[int, object] = {}
+        self._released: set = set()
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[Hashable]:
+        """The key whose updates must not overlap; None for updates that can run freely"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return ('user', update.effective_user.id)
+        if update.effective_chat:
+            return ('chat', update.effective_chat.id)
+        return None
+
+    @property
+    def active_keys(self) -> int:
+        """Number of users/chats that currently have updates in flight"""
+        return len(self._locks)
+
+    def release_waiting(self) -> List[object]:
+        """Give up every update whose handler has not started yet
+
+        The released updates are returned in update order. When their turn
+        comes they are skipped, so each one is either handled here or
+        returned here, never both.
+        """
+        self._released.update(self._waiting)
+        updates = list(self._waiting.values())
+        return sorted(updates, key=lambda update: getattr(update, 'update_id', 0))
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        token = id(coroutine)
+        self._waiting[token] = update
+        try:
+            key = self.ordering_key(update)
+            if key is None:
+                await super().process_update(update, coroutine)
+                return
+
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = _KeyLock()
+            entry.users += 1
+            try:
+                async with entry.lock:
+                    await super().process_update(update, coroutine)
+            finally:
+                entry.users -= 1
+                if entry.users == 0:
+                    del self._locks[key]
+        finally:
+            self._waiting.pop(token, None)
+            self._released.discard(token)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        token = id(coroutine)
+        if token in self._released:
+            coroutine.close()
+            return
+        self._waiting.pop(token, None)
+        await super().do_process_update(update, coroutine)
@@ -0,0 +1,165 @@
+"""
+Graceful lifecycle for zero-downtime restarts
+
+On SIGTERM/SIGINT polling stops, running handlers and queued updates get a
+deadline to drain, and the last processed ``update_id`` is written to a
+state file together with any updates that could not be processed in time.
+The next process replays those updates first. Telegram already treats every
+fetched update as read (``Updater.stop()`` confirms the offset), so the only
+duplicates to guard against are replayed updates that Telegram sends again.
+
+A stop signal that arrives while the bot is still starting is held until
+the application is running; a second signal stops immediately without
+draining.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+from typing import List, Optional
+
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# Runs before every other handler group
+GUARD_GROUP = -1000
+
+
+class GracefulLifecycle:
+    """Drains in-flight work on shutdown and hands off state to the next process"""
+
+    def __init__(self, state_file: str = 'bot_state.json', drain_timeout: float = 25.0):
+        self.state_file = state_file
+        self.drain_timeout = drain_timeout
+        self.application: Optional[Application] = None
+        self.last_update_id = 0
+        self._replay: List[dict] = []
+        self._replay_ids: set = set()
+        self._seen_replays: set = set()
+        self._shutdown_task: Optional[asyncio.Task] = None
+
+    def attach(self, application: Application):
+        """Register the duplicate guard and load the previous process's state"""
+        self.application = application
+        application.add_handler(TypeHandler(Update, self._guard), group=GUARD_GROUP)
+        self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self._replay = state.get('pending_updates', [])
+            os.remove(self.state_file)
+            logger.info(
+                f"Resuming after update {state.get('last_update_id')} with {len(self._replay)} pending updates"
+            )
+        except Exception as e:
+            logger.error(f"Error loading lifecycle state: {e}")
+
+    def _save_state(self, pending_updates: List[dict]):
+        state = {'last_update_id': self.last_update_id, 'pending_updates': pending_updates}
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    async def _guard(self, update: Update, context):
+        """Drop a replayed update that has already been processed once"""
+        # Only replayed ids are checked: Telegram may restart update_id numbering
+        # below an earlier value, so a high-water mark would drop new updates
+        if update.update_id in self._seen_replays:
+            logger.info(f"Skipping already processed update {update.update_id}")
+            raise ApplicationHandlerStop
+        if update.update_id in self._replay_ids:
+            self._seen_replays.add(update.update_id)
+        self.last_update_id = update.update_id
+
+    async def replay_pending(self):
+        """Queue updates left over by the previous process ahead of new ones"""
+        for data in self._replay:
+            update = Update.de_json(data, self.application.bot)
+            if update:
+                self._replay_ids.add(update.update_id)
+                await self.application.update_queue.put(update)
+        if self._replay:
+            logger.info(f"Replayed {len(self._replay)} updates from previous process")
+        self._replay = []
+
+    def install_signal_handlers(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """Route stop signals to the graceful shutdown instead of an immediate stop"""
+        loop = asyncio.get_running_loop()
+        for sig in signals:
+            loop.add_signal_handler(sig, self.request_shutdown)
+
+    def request_shutdown(self):
+        """Start the graceful shutdown; a repeated request stops immediately"""
+        if self._shutdown_task is not None:
+            self._force_stop()
+            return
+        loop = asyncio.get_running_loop()
+        if self.application.running:
+            self._shutdown_task = loop.create_task(self.shutdown())
+        else:
+            logger.info("Stop requested during startup; shutting down once the bot is running")
+            self._shutdown_task = loop.create_task(self._shutdown_when_running())
+
+    def _force_stop(self):
+        logger.warning("Stop requested again; stopping without draining")
+        if self.application.running:
+            self.application.stop_running()
+            return
+        # Still starting: nothing to drain yet, abort startup the way PTB's own stop signals do
+        self._shutdown_task.cancel()
+        raise SystemExit
+
+    async def _shutdown_when_running(self):
+        while not self.application.running:
+            await asyncio.sleep(0.1)
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Stop polling, drain updates within the deadline, persist state and stop"""
+        application = self.application
+        logger.info(f"Graceful shutdown: draining updates for up to {self.drain_timeout}s")
+
+        try:
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+
+            try:
+                await asyncio.wait_for(application.update_queue.join(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Drain deadline reached, saving unprocessed updates for the next process")
+
+            # Updates fetched but not yet started were already confirmed to Telegram,
+            # so hand them over: first those the processor is holding, then the queue
+            pending = []
+            release_waiting = getattr(application.update_processor, 'release_waiting', None)
+            if release_waiting:
+                pending.extend(release_waiting())
+            while not application.update_queue.empty():
+                pending.append(application.update_queue.get_nowait())
+                application.update_queue.task_done()
+            pending_updates = [update.to_dict() for update in pending if isinstance(update, Update)]
+
+            self._save_state(pending_updates)
+            logger.info(
+                f"Saved lifecycle state at update {self.last_update_id} "
+                f"with {len(pending_updates)} pending updates"
+            )
+        except Exception as e:
+            logger.error(f"Error during graceful shutdown: {e}")
+        finally:
+            application.stop_running()
+
+
+# Global lifecycle instance
+graceful_lifecycle = GracefulLifecycle(
+    state_file=os.getenv('LIFECYCLE_STATE_FILE', 'bot_state.json'),
+    drain_timeout=float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '25'))
+)
@@ -0,0 +1,273 @@
+"""
+On-demand profiling and slow-update capture
+
+``SamplingProfiler`` samples the event-loop thread's stack from a
+background thread and produces collapsed stacks (``frame;frame;frame N``)
+that flamegraph.pl / speedscope read directly. ``SlowUpdateRecorder``
+times every update and keeps the payload, handler names, SQL statements
+and a timing breakdown for updates over a threshold. Both cost a single
+flag check per update while disabled.
+"""
+import asyncio
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+from typing import Awaitable, Optional
+
+from telegram.ext import Application, BaseUpdateProcessor, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+_current_record: contextvars.ContextVar = contextvars.ContextVar('slow_update_record', default=None)
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling one thread's stack at a fixed interval"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.is_running = False
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, thread_id: int, stop: threading.Event):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    async def profile(self, seconds: float) -> bytes:
+        """Sample the calling thread for ``seconds`` and return collapsed stacks"""
+        self.samples.clear()
+        self.is_running = True
+        # A short switch interval lets the sampler preempt busy handlers instead of
+        # only catching the loop when it releases the GIL in select()
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval / 10))
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample, args=(threading.get_ident(), stop), name='sampling-profiler', daemon=True
+        )
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+            sys.setswitchinterval(switch_interval)
+            self.is_running = False
+        return self.collapsed()
+
+    def collapsed(self) -> bytes:
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+async def run_cprofile(seconds: float) -> bytes:
+    """Deterministically profile the event loop thread for ``seconds``"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(80)
+    return output.getvalue().encode('utf-8')
+
+
+def _callback_name(callback) -> str:
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+
+def iter_leaf_handlers(application: Application):
+    """Yield every registered handler, descending into ConversationHandlers"""
+    def walk(handler):
+        if isinstance(handler, ConversationHandler):
+            for inner in handler.entry_points + handler.fallbacks:
+                yield from walk(inner)
+            for state_handlers in handler.states.values():
+                for inner in state_handlers:
+                    yield from walk(inner)
+        else:
+            yield handler
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            yield from walk(handler)
+
+
+class SlowUpdateRecorder:
+    """Captures details of updates slower than ``threshold_ms``"""
+
+    def __init__(self, threshold_ms: float = 1000.0, max_records: int = 100,
+                 log_file: Optional[str] = 'logs/slow_updates.jsonl'):
+        self.threshold_ms = threshold_ms
+        self.log_file = log_file
+        self.records: deque = deque(maxlen=max_records)
+        self.enabled = False
+        self._sql_listening = False
+        self._log_buffer: list = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def enable(self, threshold_ms: Optional[float] = None):
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        self.enabled = True
+        self._listen_sql(True)
+
+    def disable(self):
+        self.enabled = False
+        self._listen_sql(False)
+
+    def _listen_sql(self, enabled: bool):
+        try:
+            from sqlalchemy import event
+            from sqlalchemy.engine import Engine
+        except ImportError:
+            return
+        if enabled and not self._sql_listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        elif not enabled and self._sql_listening:
+            event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._sql_listening = enabled
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_update_query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('slow_update_query_start')
+        elapsed = (time.perf_counter() - started.pop()) * 1000 if started else 0.0
+        record = _current_record.get()
+        if record is not None:
+            record['sql'].append({'statement': statement, 'ms': round(elapsed, 3)})
+
+    def instrument(self, application: Application):
+        """Wrap every registered handler callback so its time is attributed by name"""
+        for handler in iter_leaf_handlers(application):
+            if hasattr(handler, 'callback') and not getattr(handler.callback, '_slow_update_wrapped', False):
+                handler.callback = self._wrap_callback(handler.callback)
+
+    @staticmethod
+    def _wrap_callback(callback):
+        name = _callback_name(callback)
+
+        @wraps(callback)
+        async def wrapper(update, context):
+            record = _current_record.get()
+            if record is None:
+                return await callback(update, context)
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                record['handlers'].append({'name': name, 'ms': round((time.perf_counter() - started) * 1000, 3)})
+
+        wrapper._slow_update_wrapped = True
+        return wrapper
+
+    async def track(self, update: object, coroutine: Awaitable):
+        """Run an update's processing, recording it if it is slow"""
+        if not self.enabled:
+            return await coroutine
+
+        record = {'handlers': [], 'sql': []}
+        token = _current_record.set(record)
+        started = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            _current_record.reset(token)
+            total_ms = (time.perf_counter() - started) * 1000
+            if total_ms >= self.threshold_ms:
+                self._store(update, record, total_ms)
+
+    def _store(self, update: object, record: dict, total_ms: float):
+        sql_ms = sum(query['ms'] for query in record['sql'])
+        handler_ms = sum(handler['ms'] for handler in record['handlers'])
+        entry = {
+            'timestamp': time.time(),
+            'update_id': getattr(update, 'update_id', None),
+            'payload': update.to_dict() if hasattr(update, 'to_dict') else repr(update),
+            'handlers': record['handlers'],
+            'sql': record['sql'],
+            'timing': {
+                'total_ms': round(total_ms, 3),
+                'handlers_ms': round(handler_ms, 3),
+                'sql_ms': round(sql_ms, 3),
+                'sql_count': len(record['sql']),
+                'other_ms': round(max(total_ms - sql_ms, 0.0), 3)
+            }
+        }
+        self.records.append(entry)
+        logger.warning(
+            f"Slow update {entry['update_id']}: {total_ms:.0f}ms "
+            f"({len(record['sql'])} queries, {sql_ms:.0f}ms SQL) in "
+            f"{', '.join(h['name'] for h in record['handlers']) or 'no handler'}"
+        )
+        if self.log_file:
+            # The file is written off the event loop, one batch at a time
+            self._log_buffer.append(entry)
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_log())
+
+    async def _flush_log(self):
+        while self._log_buffer:
+            entries, self._log_buffer = self._log_buffer, []
+            await asyncio.to_thread(self._write_log, entries)
+
+    def _write_log(self, entries: list):
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry, default=str) + '\n' for entry in entries)
+        except Exception as e:
+            logger.error(f"Error writing slow update records: {e}")
+
+    def dump(self) -> bytes:
+        """Recent slow updates as JSON Lines"""
+        return ''.join(json.dumps(entry, default=str) + '\n' for entry in self.records).encode('utf-8')
+
+
+class ProfilingUpdateProcessor(BaseUpdateProcessor):
+    """Update processor that routes each update through the slow-update recorder"""
+
+    def __init__(self, recorder: SlowUpdateRecorder, max_concurrent_updates: int = 1):
+        super().__init__(max_concurrent_updates)
+        self.recorder = recorder
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        await self.recorder.track(update, coroutine)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+# Global profiling instances
+sampling_profiler = SamplingProfiler()
+slow_update_recorder = SlowUpdateRecorder(
+    threshold_ms=float(os.getenv('SLOW_UPDATE_THRESHOLD_MS', '1000'))
+)
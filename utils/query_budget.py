@@ -0,0 +1,67 @@
+"""
+SQL query counting for per-handler query budgets
+
+``count_queries()`` counts statements executed inside the block by the
+current thread or asyncio task (including ``asyncio.to_thread`` calls it
+makes), optionally on one engine only; statements from concurrent updates
+and background jobs are not charged to it. ``query_budget(n)``
+additionally fails when more than ``n`` statements ran, e.g.
+``with query_budget(1): read_model.dashboard(id)`` on a prepared read model.
+"""
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_active_counters: contextvars.ContextVar = contextvars.ContextVar('query_counters', default=())
+_listening = False
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block runs more SQL statements than its budget"""
+
+
+class QueryCounter:
+    def __init__(self, engine: Optional[Engine] = None):
+        self.engine = engine
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+def _on_execute(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active_counters.get():
+        if counter.engine is None or conn.engine is counter.engine:
+            counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine: Optional[Engine] = None):
+    """Count statements executed inside the block, on ``engine`` if given"""
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _on_execute)
+        _listening = True
+
+    counter = QueryCounter(engine)
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, engine: Optional[Engine] = None):
+    """Fail if the block executes more than ``max_queries`` statements"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > max_queries:
+        statements = '\n'.join(f"  {i}. {s}" for i, s in enumerate(counter.statements, 1))
+        raise QueryBudgetExceeded(
+            f"Expected at most {max_queries} queries, got {counter.count}:\n{statements}"
+        )
@@ -0,0 +1,182 @@
+"""
+Event-loop blocking watchdog
+
+A heartbeat coroutine measures how late the event loop wakes it up, and a
+monitor thread snapshots the loop thread's stack as soon as a heartbeat is
+overdue. The stack is matched against registered handler and job callbacks
+so each stall is attributed to the code that blocked, then reported through
+the log and ``snapshot()`` metrics. In strict mode every stall over the
+budget is kept and ``check()`` raises, which lets tests fail on blocking
+calls.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from telegram.ext import Application
+
+from utils.profiling import iter_leaf_handlers
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 5000)
+
+
+class EventLoopBlockedError(AssertionError):
+    """Raised in strict mode when the loop was blocked longer than the budget"""
+
+
+def _code_of(callback: Callable):
+    callback = inspect.unwrap(callback)
+    return getattr(getattr(callback, '__func__', callback), '__code__', None)
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and attributes blocking calls to callbacks"""
+
+    def __init__(self, threshold_ms: float = 250.0, interval: float = 0.05, strict: bool = False):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.strict = strict
+        self.violations: List[dict] = []
+        self.blocked_by: Counter = Counter()
+        self.lag_buckets: Counter = Counter()
+        self.max_lag_ms = 0.0
+        self.beats = 0
+        self._callbacks: Dict[object, str] = {}
+        self._last_beat = 0.0
+        self._stall: Optional[dict] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, callback: Callable, label: Optional[str] = None):
+        """Attribute stalls inside ``callback`` to ``label``"""
+        code = _code_of(callback)
+        if code is not None:
+            self._callbacks[code] = label or getattr(inspect.unwrap(callback), '__qualname__', repr(callback))
+
+    def register_application(self, application: Application):
+        """Register every handler callback, labelled with its pattern when it has one"""
+        for handler in iter_leaf_handlers(application):
+            callback = getattr(handler, 'callback', None)
+            if callback is None:
+                continue
+            name = getattr(inspect.unwrap(callback), '__qualname__', repr(callback))
+            pattern = getattr(getattr(handler, 'pattern', None), 'pattern', None)
+            self.register(callback, f"{name} [{pattern}]" if pattern else name)
+
+    def _attribute(self, frame) -> str:
+        innermost = None
+        while frame is not None:
+            label = self._callbacks.get(frame.f_code)
+            if label:
+                return label
+            if innermost is None:
+                innermost = frame
+            frame = frame.f_back
+        if innermost is None:
+            return 'unknown'
+        return f"{innermost.f_code.co_name} ({os.path.basename(innermost.f_code.co_filename)})"
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            beat = self._last_beat
+            overdue = time.monotonic() - beat - self.interval
+            if overdue < self.threshold or (self._stall and self._stall['beat'] == beat):
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._stall = {
+                'beat': beat,
+                'callback': self._attribute(frame),
+                'stack': ''.join(traceback.format_stack(frame))
+            }
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_beat = time.monotonic()
+            self._record(self._last_beat - started - self.interval)
+
+    def _record(self, lag: float):
+        lag_ms = max(lag, 0.0) * 1000
+        self.beats += 1
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        for bucket in LAG_BUCKETS_MS:
+            if lag_ms <= bucket:
+                self.lag_buckets[f"le_{bucket}ms"] += 1
+                break
+        else:
+            self.lag_buckets['gt_5000ms'] += 1
+
+        if lag < self.threshold:
+            return
+
+        stall, self._stall = self._stall, None
+        callback = stall['callback'] if stall else 'unknown'
+        self.blocked_by[callback] += 1
+        logger.warning(
+            f"Event loop blocked for {lag_ms:.0f}ms by {callback}\n{stall['stack'] if stall else ''}"
+        )
+        if self.strict:
+            self.violations.append({'callback': callback, 'lag_ms': round(lag_ms, 1),
+                                    'stack': stall['stack'] if stall else ''})
+
+    def start(self):
+        """Start the heartbeat on the running loop and the monitor thread"""
+        if self._heartbeat_task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._monitor = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._monitor.start()
+        logger.info(f"Loop watchdog started (threshold {self.threshold * 1000:.0f}ms)")
+
+    def stop(self):
+        """Stop watching; call ``check()`` afterwards to fail on recorded stalls"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._monitor:
+            self._stop.set()
+            self._monitor.join()
+            self._monitor = None
+        if self.violations:
+            logger.warning(f"Loop watchdog recorded {len(self.violations)} blocking call(s) in strict mode")
+
+    def check(self):
+        """Raise EventLoopBlockedError if strict mode recorded any stall"""
+        if self.strict and self.violations:
+            worst = max(self.violations, key=lambda v: v['lag_ms'])
+            raise EventLoopBlockedError(
+                f"{len(self.violations)} blocking call(s) over {self.threshold * 1000:.0f}ms; "
+                f"worst {worst['lag_ms']}ms in {worst['callback']}\n{worst['stack']}"
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            'beats': self.beats,
+            'max_lag_ms': round(self.max_lag_ms, 1),
+            'lag_buckets': dict(self.lag_buckets),
+            'blocked_by': dict(self.blocked_by)
+        }
+
+
+# Global loop watchdog instance
+loop_watchdog = LoopWatchdog(
+    threshold_ms=float(os.getenv('LOOP_BLOCK_THRESHOLD_MS', '250')),
+    strict=os.getenv('LOOP_WATCHDOG_STRICT', '').lower() in ('1', 'true', 'yes')
+)